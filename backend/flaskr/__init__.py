@@ -1,11 +1,13 @@
 import os
+import hmac
 from werkzeug.exceptions import HTTPException
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
 from models import setup_db, Question, Category
+from .profiler import SamplingProfiler
 
 
 ##############################################################################
@@ -37,6 +39,16 @@ def format_categories(categories_unformatted):
         categories_formatted[category.id] = category.type
     return categories_formatted
 
+# - Check a request for the profiler token, sent as the 'X-Profiler-Token'
+# - header only, query strings would leak it into access logs
+def has_profiler_token(request, token):
+    if not token:
+        return False
+    supplied = request.headers.get('X-Profiler-Token')
+    if not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
 
 def create_app(test_config=None):
 
@@ -49,6 +61,19 @@ def create_app(test_config=None):
 
     # - Create and configure the app
     app = Flask(__name__)
+
+    # - Profiler settings: the token guards per request profiling and the
+    # - /profiler endpoints, the sample rate is the fraction of all requests
+    # - profiled without a token and the interval is the seconds between
+    # - stack samples
+    app.config.from_mapping(
+        PROFILER_TOKEN=os.environ.get('PROFILER_TOKEN'),
+        PROFILER_SAMPLE_RATE=float(os.environ.get('PROFILER_SAMPLE_RATE', 0)),
+        PROFILER_INTERVAL=float(os.environ.get('PROFILER_INTERVAL', 0.005))
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
     setup_db(app)
 
     # - Activate CORS   
@@ -65,7 +90,84 @@ def create_app(test_config=None):
             "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
         )
         return response
- 
+
+
+
+    ##########################################################################
+    # - Profiling
+    ##########################################################################
+
+
+    profiler = SamplingProfiler(interval=app.config['PROFILER_INTERVAL'])
+
+    # - Sample the request if it carries the profiler token or is picked at
+    # - the configured rate; without a token nothing is sampled since the
+    # - samples could never be read, and the /profiler endpoints never are
+    @app.before_request
+    def start_profiling():
+        if request.url_rule is None or request.endpoint.startswith('profiler'):
+            return
+        token = app.config.get('PROFILER_TOKEN')
+        if not token:
+            return
+        sample_rate = app.config.get('PROFILER_SAMPLE_RATE') or 0
+        if (has_profiler_token(request, token)
+                or (sample_rate > 0 and random.random() < sample_rate)):
+            profiler.start(f'{request.method} {request.url_rule.rule}')
+
+    # - Stop sampling once the response, including jsonify, is done
+    @app.teardown_request
+    def stop_profiling(error=None):
+        profiler.stop()
+
+    # - Abort unless the request carries the profiler token
+    def require_profiler_token():
+        if not has_profiler_token(request, app.config.get('PROFILER_TOKEN')):
+            abort(403)
+
+    # - GET endpoint to '/profiler': Returns the profiled requests and
+    # - samples per endpoint
+    @app.route('/profiler', methods=['GET'])
+    def profiler_summary():
+        require_profiler_token()
+        return jsonify({
+            'success': True,
+            'interval': profiler.interval,
+            'endpoints': profiler.summary()
+            })
+
+    # - GET endpoint to '/profiler/stacks?format=${collapsed|speedscope}':
+    # - Returns the aggregated stacks, optionally for a single endpoint given
+    # - as e.g. 'endpoint=POST /quizzes'
+    @app.route('/profiler/stacks', methods=['GET'])
+    def profiler_stacks():
+        require_profiler_token()
+        endpoint = request.args.get('endpoint', None)
+        export_format = request.args.get('format', 'collapsed')
+
+        if export_format == 'collapsed':
+            return Response(profiler.collapsed(endpoint),
+                            mimetype='text/plain')
+        elif export_format == 'speedscope':
+            export = profiler.speedscope(endpoint)
+
+            # - A speedscope file without profiles cannot be opened
+            if len(export['profiles']) == 0:
+                abort(404)
+
+            return jsonify(export)
+        else:
+            abort(400)
+
+    # - DELETE endpoint to '/profiler': Drops all aggregated samples
+    @app.route('/profiler', methods=['DELETE'])
+    def profiler_reset():
+        require_profiler_token()
+        profiler.reset()
+        return jsonify({
+            'success': True
+            })
+
 
 
     ##########################################################################
@@ -359,6 +461,18 @@ def create_app(test_config=None):
             }), 400
         )
 
+    # - 403: Forbidden
+    @app.errorhandler(403)
+    def forbidden(error):
+        return (
+            jsonify({
+                "success": False,
+                "error": 403,
+                "message": "forbidden"
+            }),
+            403,
+        )
+
     # - 404: Not found
     @app.errorhandler(404)
     def not_found(error):
@@ -0,0 +1,282 @@
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+
+logger = logging.getLogger(__name__)
+
+
+##############################################################################
+# - Sampling profiler
+##############################################################################
+
+
+# - Deepest stack kept per sample, deeper stacks lose their middle frames
+MAX_STACK_DEPTH = 256
+
+# - Frame standing in for the frames dropped from the middle of a deep stack
+TRUNCATED_FRAME = ('[truncated]', '', 0)
+
+# - Stack holding the wall time of profiled requests that no sample covers
+UNSAMPLED_STACK = (('[unsampled]', '', 0),)
+
+
+# - Label a code object as (function name, short file path, first line)
+def frame_label(code):
+    filename = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return (code.co_name, filename, code.co_firstlineno)
+
+
+# - Render a frame label for the collapsed stack format
+def format_label(label):
+    name, filename, line = label
+    if not filename:
+        return name
+    return '{} ({}:{})'.format(name, filename, line)
+
+
+# - Walk a frame up to the thread root, returning the stack root first;
+# - stacks deeper than max_depth keep their root and innermost frames so
+# - the flame graph roots stay identical across samples
+def collect_stack(frame, max_depth=MAX_STACK_DEPTH):
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    if len(stack) > max_depth:
+        keep_root = max_depth // 2
+        keep_leaf = max_depth - keep_root - 1
+        stack = stack[:keep_root] + [TRUNCATED_FRAME] + stack[-keep_leaf:]
+    return tuple(stack)
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving profiled requests.
+
+    A single daemon thread ticks every `interval` seconds while at least one
+    request is being profiled and sleeps otherwise, so requests that are not
+    profiled pay nothing beyond a dictionary lookup. Ticks follow a fixed
+    schedule that starts at a random phase, so each sample stands for one
+    `interval` of wall time. Time no sample accounts for, including requests
+    that finished between two ticks, is reported under an '[unsampled]'
+    frame. Stacks are aggregated per endpoint and can be exported as
+    collapsed stacks or speedscope JSON.
+    """
+
+    def __init__(self, interval=0.005, max_depth=MAX_STACK_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        # - Switch interval in place before profiling began
+        self._switch_interval = None
+        # - thread ident -> (endpoint key, start time)
+        self._active = {}
+        # - endpoint key -> Counter of stack tuples -> seconds
+        self._stacks = {}
+        # - endpoint key -> number of samples taken
+        self._samples = Counter()
+        # - endpoint key -> number of profiled requests
+        self._requests = Counter()
+        # - endpoint key -> wall time of finished profiled requests
+        self._wall = Counter()
+
+    # - Start sampling the calling thread on behalf of `endpoint`
+    def start(self, endpoint):
+        with self._lock:
+            # - A CPU-bound request holds the GIL for a whole switch interval
+            # - (5 ms by default) before the sampler gets to run, which hides
+            # - short phases such as format() or jsonify and shifts their
+            # - ticks onto whatever runs next; shorten it while profiling
+            if not self._active:
+                self._switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(
+                    min(self._switch_interval, self.interval / 50))
+            self._active[threading.get_ident()] = (
+                endpoint, time.perf_counter())
+            self._requests[endpoint] += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='trivia-profiler', daemon=True
+                )
+                self._thread.start()
+            self._wakeup.set()
+
+    # - Stop sampling the calling thread, safe to call when not started
+    def stop(self):
+        now = time.perf_counter()
+        with self._lock:
+            state = self._active.pop(threading.get_ident(), None)
+            if state is None:
+                return
+            if not self._active and self._switch_interval is not None:
+                sys.setswitchinterval(self._switch_interval)
+                self._switch_interval = None
+            endpoint, start_time = state
+            self._wall[endpoint] += now - start_time
+
+    # - Drop all aggregated samples
+    def reset(self):
+        with self._lock:
+            self._stacks = {}
+            self._samples = Counter()
+            self._requests = Counter()
+            self._wall = Counter()
+
+    def _run(self):
+        while True:
+            # - Block while idle, then start at a random phase so ticks do
+            # - not line up with the start of the waking request
+            self._wakeup.wait()
+            next_tick = time.perf_counter() + random.uniform(0, self.interval)
+
+            while True:
+                time.sleep(max(0, next_tick - time.perf_counter()))
+                with self._lock:
+                    if not self._active:
+                        self._wakeup.clear()
+                        break
+
+                # - Keep sampling if a single sample fails, a dead thread
+                # - would silently leave every later request without samples
+                try:
+                    self._sample()
+                except Exception:
+                    logger.exception('Profiler failed to take a sample')
+
+                # - Skip ticks missed while waiting for the GIL instead of
+                # - catching up with samples of the same stack
+                next_tick += self.interval
+                now = time.perf_counter()
+                if next_tick < now:
+                    next_tick += ((now - next_tick) // self.interval + 1
+                                  ) * self.interval
+
+    def _sample(self):
+        with self._lock:
+            idents = list(self._active)
+        if not idents:
+            return
+
+        frames = sys._current_frames()
+        stacks = {}
+        for ident in idents:
+            frame = frames.get(ident)
+            if frame is not None:
+                stacks[ident] = collect_stack(frame, self.max_depth)
+        # - Release the frame references as soon as possible
+        del frames
+
+        with self._lock:
+            for ident, stack in stacks.items():
+                # - Skip threads whose request finished meanwhile
+                state = self._active.get(ident)
+                if state is None:
+                    continue
+                self._stacks.setdefault(state[0], Counter())[stack] += (
+                    self.interval)
+                self._samples[state[0]] += 1
+
+    # - Copy the aggregated data, optionally restricted to one endpoint
+    def snapshot(self, endpoint=None):
+        with self._lock:
+            stacks = {key: Counter(counter)
+                      for key, counter in self._stacks.items()}
+            samples = Counter(self._samples)
+            requests = Counter(self._requests)
+            wall = Counter(self._wall)
+        # - Wall time the samples fall short of, e.g. requests that finished
+        # - between two ticks, is reported as '[unsampled]'
+        for key, seconds in wall.items():
+            counter = stacks.setdefault(key, Counter())
+            unsampled = seconds - sum(counter.values())
+            if unsampled > 0:
+                counter[UNSAMPLED_STACK] = unsampled
+        if endpoint is not None:
+            stacks = {endpoint: stacks.get(endpoint, Counter())}
+            samples = Counter({endpoint: samples.get(endpoint, 0)})
+            requests = Counter({endpoint: requests.get(endpoint, 0)})
+        return stacks, samples, requests
+
+    # - Summarise requests, samples, wall time and the part of it no sample
+    # - covers per endpoint
+    def summary(self):
+        stacks, samples, requests = self.snapshot()
+        return {
+            endpoint: {
+                'requests': requests[endpoint],
+                'samples': samples[endpoint],
+                'seconds': sum(stacks.get(endpoint, Counter()).values()),
+                'unsampled_seconds': stacks.get(endpoint, Counter()).get(
+                    UNSAMPLED_STACK, 0)
+            }
+            for endpoint in sorted(requests)
+        }
+
+    # - Export in the collapsed stack format read by flamegraph.pl and
+    # - speedscope: one 'frame;frame;frame weight' line per distinct stack,
+    # - rooted at the endpoint and weighted in microseconds
+    def collapsed(self, endpoint=None):
+        stacks, _, _ = self.snapshot(endpoint)
+        lines = []
+        for key in sorted(stacks):
+            for stack, seconds in stacks[key].most_common():
+                names = [key] + [format_label(label) for label in stack]
+                lines.append('{} {}'.format(
+                    ';'.join(name.replace(';', ',') for name in names),
+                    int(round(seconds * 1e6))))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    # - Export in the speedscope file format with one sampled profile per
+    # - endpoint with data, weighted in seconds
+    def speedscope(self, endpoint=None):
+        stacks, _, _ = self.snapshot(endpoint)
+        frames = []
+        frame_index = {}
+        profiles = []
+
+        for key in sorted(stacks):
+            if not stacks[key]:
+                continue
+            samples = []
+            weights = []
+            for stack, seconds in stacks[key].most_common():
+                indices = []
+                for label in stack:
+                    if label not in frame_index:
+                        frame_index[label] = len(frames)
+                        frames.append({
+                            'name': label[0],
+                            'file': label[1],
+                            'line': label[2]
+                        })
+                    indices.append(frame_index[label])
+                samples.append(indices)
+                weights.append(seconds)
+
+            profiles.append({
+                'type': 'sampled',
+                'name': key,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            })
+
+        export = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': 'trivia',
+            'exporter': 'flaskr.profiler',
+            'shared': {'frames': frames},
+            'profiles': profiles
+        }
+        # - speedscope rejects an active profile index without profiles
+        if profiles:
+            export['activeProfileIndex'] = 0
+        return export
@@ -181,6 +181,119 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'bad request')
 
 
+    # - Test /profiler endpoints
+    def profiler_summary(self):
+        response = self.client().get('/profiler', headers={
+                                                'X-Profiler-Token': 'secret'})
+        return json.loads(response.data)['endpoints']
+
+    def test_profiler_summary(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        self.client().get('/categories', headers={'X-Profiler-Token':
+                                                        'secret'})
+        response = self.client().get('/profiler', headers={
+                                                'X-Profiler-Token': 'secret'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['endpoints']['GET /categories']['requests'], 1)
+        self.assertIn('samples', data['endpoints']['GET /categories'])
+        self.assertIn('seconds', data['endpoints']['GET /categories'])
+
+    def test_profiler_without_token(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        self.client().get('/categories')
+
+        self.assertNotIn('GET /categories', self.profiler_summary())
+
+    def test_profiler_sample_rate(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        self.app.config['PROFILER_SAMPLE_RATE'] = 1.0
+        self.client().get('/categories')
+        self.client().get('/categories')
+
+        self.assertEqual(
+            self.profiler_summary()['GET /categories']['requests'], 2)
+
+    def test_profiler_sample_rate_without_token(self):
+        self.app.config['PROFILER_TOKEN'] = None
+        self.app.config['PROFILER_SAMPLE_RATE'] = 1.0
+        self.client().get('/categories')
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+
+        self.assertNotIn('GET /categories', self.profiler_summary())
+
+    def test_profiler_speedscope(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        self.client().get('/questions', headers={'X-Profiler-Token':
+                                                        'secret'})
+        response = self.client().get('/profiler/stacks?format=speedscope',
+                                     headers={'X-Profiler-Token': 'secret'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['profiles']), 1)
+        self.assertEqual(data['activeProfileIndex'], 0)
+
+        profile = data['profiles'][0]
+        self.assertEqual(profile['name'], 'GET /questions')
+        self.assertTrue(profile['samples'])
+        self.assertEqual(len(profile['samples']), len(profile['weights']))
+        for sample in profile['samples']:
+            for index in sample:
+                self.assertTrue(0 <= index < len(data['shared']['frames']))
+
+    def test_404_profiler_speedscope(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        response = self.client().get('/profiler/stacks?format=speedscope',
+                                     headers={'X-Profiler-Token': 'secret'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_400_profiler_stacks(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        response = self.client().get('/profiler/stacks?format=foo',
+                                     headers={'X-Profiler-Token': 'secret'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_reset_profiler(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        self.client().get('/categories', headers={'X-Profiler-Token':
+                                                        'secret'})
+        response = self.client().delete('/profiler', headers={
+                                                'X-Profiler-Token': 'secret'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(self.profiler_summary(), {})
+
+    def test_403_profiler(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        response = self.client().get('/profiler', headers={
+                                                'X-Profiler-Token': 'wrong'})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'forbidden')
+
+    def test_403_profiler_without_token(self):
+        self.app.config['PROFILER_TOKEN'] = 'secret'
+        response = self.client().delete('/profiler')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(data['success'], False)
+
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
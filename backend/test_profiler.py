@@ -0,0 +1,218 @@
+import sys
+import threading
+import time
+import unittest
+
+from flaskr.profiler import SamplingProfiler, collect_stack, TRUNCATED_FRAME
+
+
+# - Keep the calling thread busy for `duration` seconds
+def busy(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+# - Profile a busy request on the calling thread
+def profiled_request(profiler, endpoint, duration):
+    profiler.start(endpoint)
+    try:
+        busy(duration)
+    finally:
+        profiler.stop()
+
+
+# - Wait on I/O for `duration` seconds, releasing the GIL like a SQL query
+def wait_io(duration):
+    time.sleep(duration)
+
+
+# - Profile a request spending `io` seconds on I/O, then `cpu` on CPU work
+def two_phase_request(profiler, endpoint, io, cpu):
+    profiler.start(endpoint)
+    try:
+        wait_io(io)
+        busy(cpu)
+    finally:
+        profiler.stop()
+
+
+# - Sum the seconds of an endpoint's stacks by their innermost function
+def seconds_by_leaf(profiler, endpoint):
+    stacks = profiler.snapshot(endpoint)[0][endpoint]
+    seconds = {}
+    for stack, weight in stacks.items():
+        seconds[stack[-1][0]] = seconds.get(stack[-1][0], 0) + weight
+    return seconds
+
+
+# - Build a stack of `depth` nested calls and collect it at the bottom
+def nested(depth, max_depth):
+    if depth == 0:
+        return collect_stack(sys._getframe(), max_depth)
+    return nested(depth - 1, max_depth)
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+    """This class represents the sampling profiler test case"""
+
+
+
+    ##########################################################################
+    # - Config
+    ##########################################################################
+
+
+    def setUp(self):
+        """Define a profiler with a short sample interval."""
+        self.profiler = SamplingProfiler(interval=0.001)
+
+
+
+    ##########################################################################
+    # - Tests
+    ##########################################################################
+
+
+    # - Test sampling
+    def test_samples_busy_request(self):
+        profiled_request(self.profiler, 'GET /busy', 0.2)
+        summary = self.profiler.summary()
+
+        self.assertEqual(summary['GET /busy']['requests'], 1)
+        self.assertGreater(summary['GET /busy']['samples'], 0)
+        self.assertAlmostEqual(summary['GET /busy']['seconds'], 0.2,
+                               delta=0.05)
+
+    def test_samples_concurrent_requests(self):
+        threads = [threading.Thread(target=profiled_request,
+                                    args=(self.profiler, 'GET /busy', 0.1))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = self.profiler.summary()
+
+        self.assertEqual(summary['GET /busy']['requests'], 3)
+        self.assertAlmostEqual(summary['GET /busy']['seconds'], 0.3,
+                               delta=0.1)
+
+    def test_attributes_time_to_phases(self):
+        for _ in range(10):
+            two_phase_request(self.profiler, 'GET /phases', 0.01, 0.03)
+        seconds = seconds_by_leaf(self.profiler, 'GET /phases')
+        sampled = seconds.get('wait_io', 0) + seconds.get('busy', 0)
+
+        self.assertAlmostEqual(sampled, 0.4, delta=0.1)
+        self.assertAlmostEqual(seconds.get('busy', 0) / sampled, 0.75,
+                               delta=0.1)
+
+    def test_unsampled_requests(self):
+        profiler = SamplingProfiler(interval=60)
+        profiled_request(profiler, 'GET /busy', 0.01)
+        summary = profiler.summary()['GET /busy']
+        lines = profiler.collapsed().splitlines()
+
+        self.assertEqual(summary['samples'], 0)
+        self.assertAlmostEqual(summary['unsampled_seconds'], 0.01,
+                               delta=0.005)
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith('GET /busy;[unsampled] '))
+
+    def test_stop_without_start(self):
+        self.profiler.stop()
+
+        self.assertEqual(self.profiler.summary(), {})
+
+    def test_reset(self):
+        profiled_request(self.profiler, 'GET /busy', 0.05)
+        self.profiler.reset()
+
+        self.assertEqual(self.profiler.summary(), {})
+        self.assertEqual(self.profiler.collapsed(), '')
+
+    def test_sampler_survives_errors(self):
+        profiler = FailingOnceProfiler(interval=0.001)
+        profiled_request(profiler, 'GET /busy', 0.1)
+
+        self.assertTrue(profiler.failed)
+        self.assertGreater(profiler.summary()['GET /busy']['samples'], 0)
+
+
+    # - Test stack collection
+    def test_truncated_stack_keeps_root(self):
+        shallow = nested(0, 16)
+        deep = nested(100, 16)
+        kept = min(8, len(shallow))
+
+        self.assertEqual(len(deep), 16)
+        self.assertEqual(deep[8], TRUNCATED_FRAME)
+        self.assertEqual(deep[:kept], shallow[:kept])
+        self.assertEqual(deep[-1][0], 'nested')
+
+
+    # - Test exports
+    def test_collapsed_format(self):
+        profiled_request(self.profiler, 'GET /busy', 0.1)
+        lines = self.profiler.collapsed().splitlines()
+
+        self.assertTrue(lines)
+        for line in lines:
+            stack, weight = line.rsplit(' ', 1)
+            frames = stack.split(';')
+            self.assertEqual(frames[0], 'GET /busy')
+            self.assertGreater(len(frames), 1)
+            self.assertTrue(weight.isdigit())
+
+    def test_speedscope_format(self):
+        profiled_request(self.profiler, 'GET /busy', 0.1)
+        profiled_request(self.profiler, 'POST /busy', 0.1)
+        export = self.profiler.speedscope()
+        frames = export['shared']['frames']
+
+        self.assertEqual([profile['name'] for profile in export['profiles']],
+                         ['GET /busy', 'POST /busy'])
+        for profile in export['profiles']:
+            self.assertEqual(profile['type'], 'sampled')
+            self.assertEqual(profile['unit'], 'seconds')
+            self.assertIn('activeProfileIndex', export)
+            self.assertEqual(len(profile['samples']),
+                             len(profile['weights']))
+            self.assertAlmostEqual(profile['endValue'],
+                                   sum(profile['weights']))
+            for sample in profile['samples']:
+                for index in sample:
+                    self.assertTrue(0 <= index < len(frames))
+
+    def test_speedscope_single_endpoint(self):
+        profiled_request(self.profiler, 'GET /busy', 0.05)
+        profiled_request(self.profiler, 'POST /busy', 0.05)
+        export = self.profiler.speedscope('POST /busy')
+
+        self.assertEqual([profile['name'] for profile in export['profiles']],
+                         ['POST /busy'])
+
+    def test_speedscope_empty(self):
+        export = self.profiler.speedscope()
+
+        self.assertEqual(export['profiles'], [])
+        self.assertNotIn('activeProfileIndex', export)
+
+
+class FailingOnceProfiler(SamplingProfiler):
+    """Profiler whose first sample raises"""
+
+    failed = False
+
+    def _sample(self):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError('sample failed')
+        super()._sample()
+
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()